@@ -1,12 +1,37 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-import base64
+import hashlib
 import json
-from datetime import datetime
-
-from dash import Dash, html, dcc, Input, Output
+import mmap
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from dash import Dash, ctx, html, dcc, no_update, Input, Output, State
+from flask import Response, abort, g, request, send_from_directory
+from flask_compress import Compress
 import dash_bootstrap_components as dbc
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
+
+try:
+    import orjson  # decodificação bem mais rápida dos GeoJSON grandes
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # figuras dos callbacks (GeoJSON + arrays numpy) serializadas pelo orjson, não pelo json da stdlib
+    pio.json.config.default_engine = "orjson"
+
+try:
+    import ijson  # leitura em streaming das features (menor pico de memória)
+except ImportError:
+    ijson = None
 
 # ----------------- CONFIGURAÇÕES ----------------- #
 BASE_DIR = Path(__file__).parent
@@ -17,9 +42,39 @@ CAMADAS_FALLBACK_DIRS = [CAMADAS_DIR, BASE_DIR]  # procura primeiro na pasta, de
 RESUMO_PATH = BASE_DIR / "resumo_painel.json"
 RESUMO_SAUDE_PATH = BASE_DIR / "resumo_saude_chuva.json"
 
+# GeoJSON já processado (pickle), reaproveitado entre reinícios enquanto o arquivo fonte não mudar
+CACHE_DIR = BASE_DIR / ".cache"
+CACHE_VERSION = 9  # incrementar se mudar o formato do que é salvo
+
+# Rota Flask que serve os PNGs de IMG_DIR (o navegador baixa/cacheia cada imagem uma vez)
+PNG_ROUTE = "/ecmwf_png/"
+
 # Recorte padrão (igual às figuras)
 # (lon_min, lon_max, lat_min, lat_max)
 EXTENT = (-85, -30, -35, 8)
+CENTER_LAT = (EXTENT[2] + EXTENT[3]) / 2
+CENTER_LON = (EXTENT[0] + EXTENT[1]) / 2
+
+# layout.mapbox fixo do mapa integrado (sem minzoom/maxzoom: Plotly 6+ não aceita no layout.mapbox)
+_MAPBOX_LAYOUT = dict(
+    style="open-street-map",
+    center=dict(lat=CENTER_LAT, lon=CENTER_LON),
+    zoom=2.8,
+    bounds=dict(west=EXTENT[0], east=EXTENT[1], south=EXTENT[2], north=EXTENT[3]),
+    layers=[],
+)
+
+# Template enxuto compartilhado por todas as figuras. O "plotly" padrão vai inteiro
+# (colorscales, eixos, hover...) no JSON de cada figura; este só leva o que o painel usa.
+pio.templates["painel"] = go.layout.Template(layout=dict(
+    paper_bgcolor="white",
+    plot_bgcolor="white",
+    margin=dict(l=0, r=0, t=45, b=0),
+    dragmode="pan",
+    title=dict(x=0.5, xanchor="center"),
+    font=dict(color="#2a3f5f"),
+))
+pio.templates.default = "painel"
 
 # ----------------- VARIÁVEIS DISPONÍVEIS (PREVISÃO PNG) ----------------- #
 VAR_OPCOES = {
@@ -29,6 +84,55 @@ VAR_OPCOES = {
     "tmed": {"label": "Temperatura média diária (°C)", "prefix": "ecmwf_tmed_", "usa_data": True},
     "prec_acum": {"label": "Precipitação acumulada no período (mm)", "prefix": "ecmwf_prec_acumulada_", "usa_data": False},
 }
+VAR_RADIO_OPTIONS = [{"label": v["label"], "value": k} for k, v in VAR_OPCOES.items()]
+
+
+# ----------------- HELPERS (JSON) ----------------- #
+def ler_geojson(path: Path) -> dict:
+    """Lê um GeoJSON com orjson (se instalado) ou json da stdlib."""
+    if orjson is not None:
+        # mmap: o orjson decodifica direto das páginas mapeadas, sem a cópia intermediária em bytes
+        with open(path, "rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # arquivo vazio não pode ser mapeado
+                return orjson.loads(f.read())
+            with mm, memoryview(mm) as mv:
+                return orjson.loads(mv)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_features_geojson(path: Path):
+    """Itera as features uma a uma; com ijson não materializa a FeatureCollection inteira."""
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "features.item", use_float=True)
+        return
+    yield from (ler_geojson(path).get("features", []) or [])
+
+
+def carregar_com_cache_disco(path: Path, tag: str, construir):
+    """Devolve construir(path), usando o pickle em CACHE_DIR se ele for mais novo que o GeoJSON."""
+    chave = hashlib.md5(str(path.resolve()).encode("utf-8")).hexdigest()[:10]
+    cache_path = CACHE_DIR / f"{path.stem}-{tag}-{chave}-v{CACHE_VERSION}.pkl"
+    try:
+        if cache_path.exists() and cache_path.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ Cache em disco ignorado ({cache_path.name}): {repr(e)}")
+
+    resultado = construir(path)
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(cache_path)
+    except Exception as e:
+        print(f"⚠️ Não consegui gravar cache em disco ({cache_path.name}): {repr(e)}")
+    return resultado
 
 
 # ----------------- HELPERS (RESUMO / CARDS) ----------------- #
@@ -254,126 +358,111 @@ def montar_cards_saude(data_iso: str | None = None, var_key: str | None = None):
 
 
 # ----------------- HELPERS (PNG) ----------------- #
+# ecmwf_prec_YYYY-MM-DD.png (não casa com ecmwf_prec_acumulada_*)
+_RE_PNG_PREC_DIARIO = re.compile(r"^ecmwf_prec_(\d{4}-\d{2}-\d{2})\.png$")
+
 def listar_datas_disponiveis():
-    datas = set()
-    for img_path in IMG_DIR.glob("ecmwf_prec_*.png"):
-        stem = img_path.stem
-        parte_data = stem.replace("ecmwf_prec_", "", 1)
-        try:
-            datetime.strptime(parte_data, "%Y-%m-%d")
-            datas.add(parte_data)
-        except ValueError:
-            continue
-    return sorted(datas)
+    with os.scandir(IMG_DIR) as it:
+        return sorted({m.group(1) for entry in it if (m := _RE_PNG_PREC_DIARIO.match(entry.name))})
 
 def formatar_label_br(data_iso: str) -> str:
-    dt = datetime.strptime(data_iso, "%Y-%m-%d")
-    return dt.strftime("%d/%m/%Y")
+    # "aaaa-mm-dd" -> "dd/mm/aaaa" por fatiamento (as datas já vêm validadas pela regex acima)
+    return f"{data_iso[8:10]}/{data_iso[5:7]}/{data_iso[:4]}"
+
+@lru_cache(maxsize=8)
+def _ultimo_png(prefix: str, dir_mtime_ns: int) -> Path | None:
+    """PNG mais recente com o prefixo (cache invalidado pelo mtime da pasta)."""
+    # uma passada só: max() em O(N), sem montar/ordenar lista de Paths
+    with os.scandir(IMG_DIR) as it:
+        nome = max(
+            (e.name for e in it if e.name.startswith(prefix) and e.name.endswith(".png")),
+            default=None,
+        )
+    return IMG_DIR / nome if nome else None
+
+# (var_key, data_iso) -> URL do PNG; preenchido uma vez no boot em preencher_png_urls().
+# PNGs novos/regerados só entram reiniciando o processo (DATAS, dropdown e animações dependem dele).
+PNG_URLS: dict[tuple[str, str | None], str] = {}
+
+def url_imagem(var_key: str, data_iso: str | None) -> str:
+    """URL servida por PNG_ROUTE (com ?v=mtime para invalidar o cache do navegador)."""
+    if var_key == "prec_acum":
+        data_iso = None
+    url = PNG_URLS.get((var_key, data_iso))
+    if url is not None:
+        return url
 
-def carregar_imagem_base64(var_key: str, data_iso: str | None) -> str:
     info = VAR_OPCOES[var_key]
     prefix = info["prefix"]
 
     if var_key == "prec_acum":
-        candidates = sorted(IMG_DIR.glob(f"{prefix}*.png"))
-        if not candidates:
+        img_path = _ultimo_png(prefix, IMG_DIR.stat().st_mtime_ns)
+        if img_path is None:
             print(f"⚠️ Nenhuma imagem acumulada encontrada com padrão {prefix}*.png")
             return ""
-        img_path = candidates[-1]
     else:
         if data_iso is None:
             return ""
         img_path = IMG_DIR / f"{prefix}{data_iso}.png"
 
-    if not img_path.exists():
+    try:
+        mtime_ns = img_path.stat().st_mtime_ns
+    except OSError:
         print(f"⚠️ PNG não encontrado: {img_path.name}")
         return ""
 
-    with open(img_path, "rb") as f:
-        encoded = base64.b64encode(f.read()).decode("ascii")
-    return f"data:image/png;base64,{encoded}"
+    return f"{PNG_ROUTE}{img_path.name}?v={mtime_ns}"
+
+def preencher_png_urls(datas_iso: list[str]) -> None:
+    """Indexa as URLs de todos os PNGs disponíveis uma única vez."""
+    for var_key, info in VAR_OPCOES.items():
+        for d in (datas_iso if info["usa_data"] else [None]):
+            url = url_imagem(var_key, d)
+            if url:
+                PNG_URLS[(var_key, d)] = url
+    print(f"ℹ️ PNG_URLS: {len(PNG_URLS)} imagens indexadas")
+
+def _imagem_mapa(src: str) -> dict:
+    """layout.images[0] das figuras estáticas: PNG esticado no quadrado [0, 1] x [0, 1]."""
+    return dict(
+        source=src,
+        xref="x", yref="y",
+        x=0, y=1,
+        sizex=1, sizey=1,
+        sizing="stretch",
+        layer="below",
+    )
 
 def construir_figura_estatica(src: str, titulo: str) -> go.Figure:
     fig = go.Figure()
     if src:
-        fig.add_layout_image(
-            dict(
-                source=src,
-                xref="x", yref="y",
-                x=0, y=1,
-                sizex=1, sizey=1,
-                sizing="stretch",
-                layer="below",
-            )
-        )
+        fig.add_layout_image(_imagem_mapa(src))
     fig.update_xaxes(visible=False, range=[0, 1])
     fig.update_yaxes(visible=False, range=[0, 1], scaleanchor="x")
-    fig.update_layout(
-        title=dict(text=titulo, x=0.5, xanchor="center"),
-        margin=dict(l=0, r=0, t=45, b=0),
-        dragmode="pan",
-        paper_bgcolor="white",
-        plot_bgcolor="white",
-    )
+    fig.update_layout(title_text=titulo)
     return fig
 
-def construir_animacao(var_key: str, datas_iso: list[str], titulo: str) -> go.Figure:
+def construir_animacao(var_key: str, datas_iso: list[str], titulo: str) -> dict:
+    """
+    Figura da animação já como dict. Só a casca (eixos, título, botão Play) passa pelo
+    go.Figure; frames e passos do slider, um por data, entram como dicts puros, sem a
+    validação do graph_objects.
+    """
     if not datas_iso:
-        return construir_figura_estatica("", "Sem dados para animar")
+        return construir_figura_estatica("", "Sem dados para animar").to_dict()
 
-    src0 = carregar_imagem_base64(var_key, datas_iso[0])
+    src0 = url_imagem(var_key, datas_iso[0])
     fig = go.Figure()
 
     if src0:
-        fig.add_layout_image(
-            dict(
-                source=src0,
-                xref="x", yref="y",
-                x=0, y=1,
-                sizex=1, sizey=1,
-                sizing="stretch",
-                layer="below",
-            )
-        )
+        fig.add_layout_image(_imagem_mapa(src0))
 
     fig.update_xaxes(visible=False, range=[0, 1])
     fig.update_yaxes(visible=False, range=[0, 1], scaleanchor="x")
 
-    frames = []
-    for d in datas_iso:
-        src = carregar_imagem_base64(var_key, d)
-        frames.append(
-            go.Frame(
-                name=d,
-                layout=dict(images=[dict(
-                    source=src, xref="x", yref="y",
-                    x=0, y=1, sizex=1, sizey=1,
-                    sizing="stretch", layer="below"
-                )]),
-            )
-        )
-    fig.frames = frames
-
-    slider_steps = [
-        dict(
-            method="animate",
-            args=[[f.name], {"mode": "immediate", "frame": {"duration": 500, "redraw": True}, "transition": {"duration": 0}}],
-            label=formatar_label_br(f.name),
-        )
-        for f in frames
-    ]
-
     fig.update_layout(
-        title=dict(text=titulo, x=0.5, xanchor="center"),
-        margin=dict(l=0, r=0, t=45, b=40),
-        dragmode="pan",
-        sliders=[dict(
-            active=0, steps=slider_steps,
-            x=0.1, y=0, len=0.9,
-            pad={"t": 30, "b": 10},
-            currentvalue={"prefix": "Data: "},
-            transition={"duration": 0},
-        )],
+        title_text=titulo,
+        margin_b=40,  # espaço do slider
         updatemenus=[dict(
             type="buttons", showactive=False,
             x=0.0, y=1.05,
@@ -383,15 +472,55 @@ def construir_animacao(var_key: str, datas_iso: list[str], titulo: str) -> go.Fi
                 args=[None, {"frame": {"duration": 500, "redraw": True}, "fromcurrent": True, "transition": {"duration": 0}}],
             )],
         )],
-        paper_bgcolor="white",
-        plot_bgcolor="white",
     )
+    figura = fig.to_dict()
+
+    figura["frames"] = [
+        {"name": d, "layout": {"images": [_imagem_mapa(src0 if i == 0 else url_imagem(var_key, d))]}}
+        for i, d in enumerate(datas_iso)
+    ]
+
+    slider_steps = [
+        dict(
+            method="animate",
+            args=[[d], {"mode": "immediate", "frame": {"duration": 500, "redraw": True}, "transition": {"duration": 0}}],
+            label=formatar_label_br(d),
+        )
+        for d in datas_iso
+    ]
+    figura["layout"]["sliders"] = [dict(
+        active=0, steps=slider_steps,
+        x=0.1, y=0, len=0.9,
+        pad={"t": 30, "b": 10},
+        currentvalue={"prefix": "Data: "},
+        transition={"duration": 0},
+    )]
+    return figura
+
+# var_key -> figura da animação (dict); DATAS é fixo durante a vida do processo
+ANIM_CACHE: dict[str, dict] = {}
+
+def animacao_cache(var_key: str) -> dict:
+    fig = ANIM_CACHE.get(var_key)
+    if fig is None:
+        titulo = f"{VAR_OPCOES[var_key]['label']} – (animação)"
+        fig = construir_animacao(var_key, DATAS, titulo)
+        ANIM_CACHE[var_key] = fig
     return fig
 
 # ----------------- HELPERS (RESOLVER ARQUIVOS NA RAIZ, CASE-INSENSITIVE) ----------------- #
+@lru_cache(maxsize=4)
+def _geojsons_na_raiz(dir_mtime_ns: int) -> tuple[Path, ...]:
+    """*.geojson da raiz (cache invalidado pelo mtime da pasta)."""
+    with os.scandir(BASE_DIR) as it:
+        return tuple(sorted(BASE_DIR / e.name for e in it if e.name.lower().endswith(".geojson")))
+
+def geojsons_na_raiz() -> tuple[Path, ...]:
+    return _geojsons_na_raiz(BASE_DIR.stat().st_mtime_ns)
+
 def resolver_arquivo_geojson_unidades(key: str) -> Path | None:
     target = f"{key}.geojson".lower()
-    for p in BASE_DIR.glob("*.geojson"):
+    for p in geojsons_na_raiz():
         if p.name.lower() == target:
             return p
     return None
@@ -402,7 +531,7 @@ def resolver_arquivo_geojson_sgb() -> Path | None:
     Procura um geojson de setores de risco na raiz.
     Prioriza nomes que contenham 'setor_risco' e 'sgb' (case-insensitive).
     """
-    cands = list(BASE_DIR.glob("*.geojson"))
+    cands = geojsons_na_raiz()
     if not cands:
         return None
 
@@ -425,19 +554,24 @@ def resolver_arquivo_geojson_sgb() -> Path | None:
     best = cands_sorted[-1]
     return best if score(best) > 0 else None
 
-def _polygon_to_lines(coords):
+_SEPARADOR_ANEL = np.array([[np.nan, np.nan]], dtype=np.float32)
+
+def _aneis_para_linhas(aneis: list) -> tuple[np.ndarray, np.ndarray]:
     """
-    coords: lista de anéis (ring). Cada ring é lista [ [lon,lat], [lon,lat], ... ]
-    Retorna (lons, lats) com None separando segmentos para Scattermapbox.
+    aneis: lista de anéis (ring). Cada ring é lista [ [lon,lat], [lon,lat], ... ]
+    Retorna (lons, lats) float32 com NaN separando segmentos para Scattermapbox
+    (cada anel vira um array de uma vez, sem laço Python por vértice).
     """
-    lons, lats = [], []
-    for ring in coords:
-        for lon, lat in ring:
-            lons.append(lon)
-            lats.append(lat)
-        lons.append(None)
-        lats.append(None)
-    return lons, lats
+    partes = []
+    for ring in aneis:
+        arr = np.asarray(ring, dtype=np.float32)
+        if arr.ndim != 2 or arr.shape[0] == 0 or arr.shape[1] < 2:
+            continue
+        partes += (arr[:, :2], _SEPARADOR_ANEL)
+    if not partes:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    xy = np.concatenate(partes)
+    return xy[:, 0], xy[:, 1]
 
 def _norm_risco(x: str) -> str:
     s = (x or "").strip().lower()
@@ -467,8 +601,7 @@ def add_sgb_risk_layer(fig: go.Figure, geojson_path: Path | None, center_lat: fl
         print("⚠️ GeoJSON SGB não encontrado na raiz (camada SGB desligada/ausente).")
         return
 
-    with open(geojson_path, "r", encoding="utf-8") as f:
-        gj = json.load(f)
+    gj = ler_geojson(geojson_path)
 
     feats = gj.get("features", []) or []
     print(f"ℹ️ SGB: arquivo={geojson_path.name} | features={len(feats)}")
@@ -483,8 +616,8 @@ def add_sgb_risk_layer(fig: go.Figure, geojson_path: Path | None, center_lat: fl
         "Sem classe": "#7F8C8D",
     }
 
-    # acumular linhas por classe
-    linhas = {k: ([], []) for k in ordem + ["Sem classe"]}
+    # acumular anéis por classe (convertidos em arrays só no fim)
+    linhas = {k: [] for k in ordem + ["Sem classe"]}
 
     for ft in feats:
         geom = ft.get("geometry", None)
@@ -499,24 +632,19 @@ def add_sgb_risk_layer(fig: go.Figure, geojson_path: Path | None, center_lat: fl
         coords = geom.get("coordinates", [])
 
         if gtype == "Polygon":
-            lons, lats = _polygon_to_lines(coords)
-            linhas.setdefault(risco, ([], []))
-            linhas[risco][0].extend(lons)
-            linhas[risco][1].extend(lats)
+            linhas.setdefault(risco, []).extend(coords)
 
         elif gtype == "MultiPolygon":
-            linhas.setdefault(risco, ([], []))
+            aneis = linhas.setdefault(risco, [])
             for poly in coords:
-                lons, lats = _polygon_to_lines(poly)
-                linhas[risco][0].extend(lons)
-                linhas[risco][1].extend(lats)
+                aneis.extend(poly)
 
     # adiciona uma trace de linhas por classe (só contorno)
     for risco in ordem + ["Sem classe"]:
         if risco not in linhas:
             continue
-        lons, lats = linhas[risco]
-        if not lons:
+        lons, lats = _aneis_para_linhas(linhas[risco])
+        if not len(lons):
             continue
 
         fig.add_trace(
@@ -564,124 +692,436 @@ def add_sgb_risk_layer(fig: go.Figure, geojson_path: Path | None, center_lat: fl
             )
 
 # ----------------- HELPERS (UNIDADES) ----------------- #
-def carregar_geojson_points(caminho: Path | None, camada: str):
-    if (caminho is None) or (not caminho.exists()):
-        print(f"⚠️ GeoJSON não encontrado (unidades): {camada}")
-        return [], [], []
-
-    with open(caminho, "r", encoding="utf-8") as f:
-        gj = json.load(f)
-
-    lats, lons, custom = [], [], []
-    feats = gj.get("features", [])
-
-    def _to_float(x):
-        try:
-            return float(x)
-        except Exception:
-            return None
+UNIDADES_KEYS = ("upa", "ubs", "ubsi")
+
+# aliases de cada campo do customdata (nome, cnes, cd_mun, dsei, polo, cod_polo), em ordem de prioridade;
+# comparados com as chaves das properties em minúsculas
+CAMPOS_UNIDADES = (
+    ("nm_fantasia", "nome_da_es", "nome"),
+    ("cd_cnes", "cnes"),
+    ("cd_mun", "cod_mun"),
+    ("dsei",),
+    ("polo_base",),
+    ("cod_polo",),
+)
 
-    for ft in feats:
+def _iter_pontos_unidades(caminho: Path, camada: str):
+    """Gera (lon, lat, meta) para cada ponto (Point ou cada item de MultiPoint)."""
+    rotulo = camada.upper()
+    for ft in iter_features_geojson(caminho):
         geom = ft.get("geometry", {}) or {}
         props = ft.get("properties", {}) or {}
 
         gtype = (geom.get("type") or "").strip().lower()
+        if gtype == "point":
+            coords_list = [geom.get("coordinates", None)]
+        elif gtype == "multipoint":
+            coords_list = geom.get("coordinates", None) or []
+        else:
+            continue
 
-        nome = (
-            props.get("nm_fantasia") or props.get("NM_FANTASIA")
-            or props.get("nome_da_es") or props.get("NOME_DA_ES")
-            or props.get("nome") or props.get("NOME") or ""
-        )
-        cnes = props.get("cd_cnes") or props.get("CD_CNES") or props.get("cnes") or props.get("CNES") or ""
-        cd_mun = props.get("cd_mun") or props.get("CD_MUN") or props.get("cod_mun") or props.get("COD_MUN") or ""
-
-        dsei = props.get("dsei") or props.get("DSEI") or ""
-        polo = props.get("polo_base") or props.get("POLO_BASE") or ""
-        cod_polo = props.get("cod_polo") or props.get("COD_POLO") or ""
+        props = {k.lower(): v for k, v in props.items()}
+        meta = (rotulo, *(next((props[k] for k in aliases if props.get(k)), "") for aliases in CAMPOS_UNIDADES))
 
-        if gtype == "point":
-            coords = geom.get("coordinates", None)
+        for coords in coords_list:
             if not coords or len(coords) < 2:
                 continue
-            lon = _to_float(coords[0]); lat = _to_float(coords[1])
-            if lon is None or lat is None:
-                continue
-            lats.append(lat); lons.append(lon)
-            custom.append([camada.upper(), nome, cnes, cd_mun, dsei, polo, cod_polo, lat, lon])
+            try:
+                lon, lat = float(coords[0]), float(coords[1])
+            except (TypeError, ValueError):
+                continue  # None, "" ou texto: ponto sem coordenada válida
+            yield lon, lat, meta
 
-        elif gtype == "multipoint":
-            coords_list = geom.get("coordinates", None)
-            if not coords_list:
-                continue
-            for coords in coords_list:
-                if not coords or len(coords) < 2:
-                    continue
-                lon = _to_float(coords[0]); lat = _to_float(coords[1])
-                if lon is None or lat is None:
-                    continue
-                lats.append(lat); lons.append(lon)
-                custom.append([camada.upper(), nome, cnes, cd_mun, dsei, polo, cod_polo, lat, lon])
+def carregar_geojson_points(caminho: Path | None, camada: str):
+    """Retorna (lats, lons, custom) como arrays numpy; custom tem shape (n, 7)."""
+    vazio = np.empty(0), np.empty(0), np.empty((0, 7), dtype=object)
+    if (caminho is None) or (not caminho.exists()):
+        print(f"⚠️ GeoJSON não encontrado (unidades): {camada}")
+        return vazio
+
+    try:
+        return carregar_com_cache_disco(caminho, camada, lambda p: _construir_pontos_unidades(p, camada))
+    except Exception as e:
+        # arquivo truncado/inválido derruba só esta camada, não o boot do painel
+        print(f"❌ ERRO no overlay (unidades): {camada} -> {repr(e)}")
+        return vazio
+
+def _construir_pontos_unidades(caminho: Path, camada: str):
+    pontos = list(_iter_pontos_unidades(caminho, camada))
+    n = len(pontos)
+    # coordenadas já vêm como float (_iter_pontos_unidades); NaN/inf caem na máscara abaixo
+    lons = np.fromiter((p[0] for p in pontos), dtype=float, count=n)
+    lats = np.fromiter((p[1] for p in pontos), dtype=float, count=n)
+
+    # lat/lon não entram no customdata: o hover usa %{lat}/%{lon} do próprio trace
+    custom = np.empty((n, 7), dtype=object)
+    if n:
+        custom[:] = [p[2] for p in pontos]
+
+    ok = np.isfinite(lats) & np.isfinite(lons)
+    # float32 sobra de precisão para marcadores (~1e-6 grau) e metade do tamanho ao serializar
+    return lats[ok].astype(np.float32), lons[ok].astype(np.float32), custom[ok]
+
+# camada -> (lats, lons, custom); as unidades não mudam em runtime, então carrega uma vez
+UNIT_CACHE: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+def preencher_unit_cache() -> None:
+    # uma thread por camada: a leitura dos GeoJSON/pickles é I/O e se sobrepõe
+    with ThreadPoolExecutor(max_workers=len(UNIDADES_KEYS)) as pool:
+        carregados = pool.map(
+            lambda key: carregar_geojson_points(resolver_arquivo_geojson_unidades(key), key),
+            UNIDADES_KEYS,
+        )
+        UNIT_CACHE.update(zip(UNIDADES_KEYS, carregados))
+    print("ℹ️ UNIT_CACHE: " + " | ".join(f"{k}={len(v[0])}" for k, v in UNIT_CACHE.items()))
+
+def kwargs_trace_unidades(camada: str) -> dict | None:
+    """Argumentos do Scattermapbox da camada (None se não houver pontos); memoizado em camada_unidades."""
+    lats, lons, custom = pontos_unidades(camada)
+    if not len(lats):
+        return None
+    return dict(
+        lat=lats,
+        lon=lons,
+        mode="markers",
+        marker=dict(size=7, opacity=0.9, color="black"),
+        customdata=custom,
+        hovertemplate=(
+            "<b>%{customdata[1]}</b><br>"
+            "Camada: %{customdata[0]}<br>"
+            "CNES: %{customdata[2]}<br>"
+            "CD_MUN: %{customdata[3]}<br>"
+            "DSEI: %{customdata[4]}<br>"
+            "Polo: %{customdata[5]} (%{customdata[6]})<br>"
+            "Lat/Lon: %{lat:.3f}, %{lon:.3f}"
+            "<extra></extra>"
+        ),
+        name=f"Unidades – {camada.upper()}",
+        legendgroup="unidades",
+        showlegend=True,
+    )
 
-    return lats, lons, custom
+def pontos_unidades(camada: str):
+    # só camadas conhecidas: o valor vem do navegador e não pode criar entradas novas no cache
+    if camada not in UNIDADES_KEYS:
+        raise ValueError(f"camada de unidades desconhecida: {camada!r}")
+    if camada not in UNIT_CACHE:
+        UNIT_CACHE[camada] = carregar_geojson_points(resolver_arquivo_geojson_unidades(camada), camada)
+    return UNIT_CACHE[camada]
 
 # ----------------- HELPERS (CAMADAS PREVISÃO) ----------------- #
-def _latest_file_in_dirs(pattern: str) -> Path | None:
-    cands = []
-    for d in CAMADAS_FALLBACK_DIRS:
-        if d.exists():
-            cands += list(d.glob(pattern))
-    cands = sorted(cands)
-    return cands[-1] if cands else None
+# nome esperado: <var>_<YYYY-MM-DD>.geojson (ex.: tmin_2026-07-07.geojson)
+_RE_CAMADA_DIARIA = re.compile(r"^([a-z_]+?)_(\d{4}-\d{2}-\d{2})\.geojson$")
+
+# (var_key, data_iso) -> Path; ("prec_acum", None) -> arquivo acumulado mais recente
+_FORECAST_INDEX: dict[tuple[str, str | None], Path] = {}
+_FORECAST_INDEX_MTIMES: tuple | None = None
+
+def _mtimes_camadas() -> tuple:
+    return tuple(d.stat().st_mtime_ns if d.exists() else None for d in CAMADAS_FALLBACK_DIRS)
+
+def _rebuild_forecast_index() -> None:
+    """Varre as pastas de camadas uma vez e indexa os arquivos por (variável, data)."""
+    global _FORECAST_INDEX, _FORECAST_INDEX_MTIMES
+    mtimes = _mtimes_camadas()  # lido antes da varredura: mudança durante ela força nova passada
+    index: dict[tuple[str, str | None], Path] = {}
+    acumulados: list[Path] = []
+    # percorre da menor para a maior prioridade: a pasta preferida sobrescreve a raiz
+    for d in reversed(CAMADAS_FALLBACK_DIRS):
+        if not d.exists():
+            continue
+        for p in d.glob("*.geojson"):
+            if p.name.startswith("prec_acum_"):
+                acumulados.append(p)
+                continue
+            m = _RE_CAMADA_DIARIA.match(p.name)
+            if m:
+                index[(m.group(1), m.group(2))] = p
+    if acumulados:
+        index[("prec_acum", None)] = max(acumulados, key=lambda p: p.name)
+
+    # troca o dict inteiro (atribuição atômica): requests concorrentes nunca veem o índice vazio
+    _FORECAST_INDEX = index
+    _FORECAST_INDEX_MTIMES = mtimes
+    print(f"ℹ️ Índice de camadas previsão: {len(index)} arquivos")
 
 def caminho_camadas_previsao_exata(var_key: str, data_iso: str | None) -> Path | None:
+    # chamado a cada request do overlay (via versao_camada_previsao), inclusive nos acertos do
+    # cache de respostas; reconstrói só quando alguma das pastas mudou (arquivo novo/removido)
+    if _FORECAST_INDEX_MTIMES != _mtimes_camadas():
+        _rebuild_forecast_index()
+
     if var_key == "prec_acum":
-        return _latest_file_in_dirs("prec_acum_*.geojson")
+        return _FORECAST_INDEX.get(("prec_acum", None))
 
     if not data_iso:
         return None
 
-    for d in CAMADAS_FALLBACK_DIRS:
-        p = d / f"{var_key}_{data_iso}.geojson"
-        if p.exists():
-            return p
-    return None
+    return _FORECAST_INDEX.get((var_key, data_iso))
 
-def carregar_geojson_poligonos_por_classe(path_geojson: Path | None):
-    if (path_geojson is None) or (not path_geojson.exists()):
-        return []
-    with open(path_geojson, "r", encoding="utf-8") as f:
-        gj = json.load(f)
+def versao_camada_previsao(var_key: str, data_iso: str | None) -> tuple[str | None, int | None]:
+    """
+    (caminho, mtime_ns) do arquivo da camada de previsão, ou (None, None) se não houver.
+    Entra na chave dos caches do overlay: arquivo novo, removido ou regerado muda a chave.
+    """
+    p = caminho_camadas_previsao_exata(var_key, data_iso)
+    if p is None:
+        return None, None
+    try:
+        return str(p), p.stat().st_mtime_ns
+    except OSError:
+        return None, None
+
+def _retangulo_celula(poly):
+    """(x0, y0, x1, y1) se o polígono for um retângulo alinhado aos eixos sem furos, senão None."""
+    if len(poly) != 1 or len(poly[0]) != 5:
+        return None
+    xs = {float(pt[0]) for pt in poly[0]}
+    ys = {float(pt[1]) for pt in poly[0]}
+    if len(xs) != 2 or len(ys) != 2:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _fundir_intervalos(grupos: dict):
+    """{chave: [(a, b), ...]} -> [(chave, a, b)] juntando intervalos encostados."""
+    for chave, ivs in grupos.items():
+        ivs.sort()
+        a, b = ivs[0]
+        for a2, b2 in ivs[1:]:
+            if a2 == b:
+                b = b2
+            else:
+                yield chave, a, b
+                a, b = a2, b2
+        yield chave, a, b
+
+def fundir_celulas_grade(geom: dict) -> dict:
+    """
+    As camadas vêm como MultiPolygon de células 0.5° (um quadrado por ponto de grade).
+    Funde células vizinhas em retângulos maiores (primeiro por linha, depois por coluna):
+    mesma área coberta, bem menos vértices para serializar e triangular no navegador.
+    Geometrias que não são só retângulos alinhados ficam como estão.
+    """
+    if not geom or geom.get("type") != "MultiPolygon":
+        return geom
+    rets = [_retangulo_celula(poly) for poly in geom.get("coordinates") or []]
+    if not rets or any(r is None for r in rets):
+        return geom
+
+    linhas: dict = {}
+    for x0, y0, x1, y1 in rets:
+        linhas.setdefault((y0, y1), []).append((x0, x1))
+    colunas: dict = {}
+    for (y0, y1), x0, x1 in _fundir_intervalos(linhas):
+        colunas.setdefault((x0, x1), []).append((y0, y1))
+
+    coords = [
+        [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]
+        for (x0, x1), y0, y1 in _fundir_intervalos(colunas)
+    ]
+    return {"type": "MultiPolygon", "coordinates": coords}
+
+def _construir_poligonos_por_classe(path_geojson: Path):
+    gj = ler_geojson(path_geojson)
     feats = gj.get("features", []) or []
 
     def _ord(ft):
         try:
             return int((ft.get("properties") or {}).get("ordem", 0))
         except Exception:
-            return 0
-
-    return sorted(feats, key=_ord)
+            return None  # "ordem" malformado: vai para o fim
+
+    brutos = [_ord(ft) for ft in feats]
+    malformado = np.fromiter((o is None for o in brutos), dtype=bool, count=len(feats))
+    ordens = np.fromiter((0 if o is None else o for o in brutos), dtype=np.int64, count=len(feats))
+    # chave principal: malformado (válidos primeiro); depois a ordem, que pode ser negativa.
+    # lexsort é estável: empates mantêm a ordem do arquivo
+    idx = np.lexsort((ordens, malformado))
+    if (idx != np.arange(len(feats))).any():  # arquivos gerados já em ordem não precisam reordenar
+        feats = [feats[i] for i in idx]
+
+    # as features são nossas depois da leitura: grava o id usado pelo Choroplethmapbox
+    # direto nas properties (sem cópias por feature a cada callback). O id é a posição
+    # já ordenada, única mesmo com "ordem" repetido ou ausente (todas as classes estão
+    # num só FeatureCollection e featureidkey precisa casar uma feature por location)
+    for i, ft in enumerate(feats):
+        ft["geometry"] = fundir_celulas_grade(ft.get("geometry"))
+        props = ft.get("properties") or {}
+        ft["properties"] = props
+        props["id"] = f"classe_{i}"
+        # "ordem" só é interpretado aqui (malformado já foi para o fim); a legenda usa a posição
+        props["rank_legenda"] = i
+    return feats
 
 # ----------------- MAPA OVERLAY ----------------- #
-def construir_mapa_sobreposicao(var_key: str, data_iso: str | None, camada_unidade: str,
-                               mostrar_previsao: bool, mostrar_unidades: bool, mostrar_sgb: bool) -> go.Figure:
-    lon_min, lon_max, lat_min, lat_max = EXTENT
-    center_lat = (lat_min + lat_max) / 2
-    center_lon = (lon_min + lon_max) / 2
+# Cada camada (previsão / SGB / unidades) vira uma tupla de traces já em dict, memoizada
+# separadamente: trocar só as unidades não remonta os polígonos da previsão e vice-versa.
+def _dados_figura(fig: go.Figure) -> tuple:
+    return tuple(fig.to_dict()["data"])
+
+@lru_cache(maxsize=64)
+def camada_previsao(var_key: str, data_iso: str | None,
+                    caminho: str | None, mtime_ns: int | None) -> tuple[tuple, tuple, str]:
+    """
+    (traces, mapbox.layers do fallback, título) da camada de previsão.
+    caminho/mtime_ns vêm de versao_camada_previsao() e só servem de chave do cache.
+    """
+    fig = go.Figure()
+    titulo_prev = "Camada previsão: (desligada)"
+
+    try:
+        print(f"ℹ️ Overlay: tentando camada previsão -> {caminho}")
+        # o lru_cache desta função (chave com caminho + mtime) é a única cópia em memória;
+        # abaixo dela só o pickle em disco, que também é refeito se o arquivo for regerado
+        feats = carregar_com_cache_disco(Path(caminho), "classes", _construir_poligonos_por_classe) if caminho else []
+        print(f"ℹ️ Overlay: features carregadas = {len(feats)}")
+
+        if not feats:
+            if var_key == "prec_acum":
+                titulo_prev = "Camada previsão: Precipitação acumulada (arquivo não encontrado)"
+            else:
+                titulo_prev = (
+                    f"Camada previsão: {VAR_OPCOES[var_key]['label']} – {formatar_label_br(data_iso)} (arquivo não encontrado)"
+                    if data_iso else "Camada previsão: (arquivo não encontrado)"
+                )
+        else:
+            # tenta Choroplethmapbox “correto” — um único trace com todas as classes
+            try:
+                n = len(feats)
+                locations, labels, colorscale, legenda = [], [], [], []
+                for i, ft in enumerate(feats):
+                    props = ft["properties"]
+                    label = props.get("label", f"classe {i}")
+                    hex_color = props.get("hex", "#999999")
+                    ordem = props.get("rank_legenda", i)
+
+                    locations.append(props["id"])
+                    labels.append(label)
+                    # faixa discreta da classe i: z=i cai no meio de [i/n, (i+1)/n]
+                    colorscale += [[i / n, hex_color], [(i + 1) / n, hex_color]]
+
+                    # entrada de legenda por classe (sem coordenadas, só aparece na legenda)
+                    legenda.append(
+                        go.Scattermapbox(
+                            lat=[None],
+                            lon=[None],
+                            mode="markers",
+                            marker=dict(size=10, color=hex_color),
+                            name=label,
+                            legendgroup="previsao",
+                            legendrank=ordem,
+                            hoverinfo="skip",
+                            showlegend=True,
+                        )
+                    )
 
+                fig.add_trace(
+                    go.Choroplethmapbox(
+                        geojson={"type": "FeatureCollection", "features": feats},
+                        featureidkey="properties.id",
+                        locations=locations,
+                        z=list(range(n)),
+                        zmin=-0.5,
+                        zmax=n - 0.5,
+                        colorscale=colorscale,
+                        text=labels,
+                        showscale=False,
+                        marker_opacity=0.60,
+                        marker_line_width=0,
+                        marker_line_color="rgba(0,0,0,0)",
+                        name="Previsão",
+                        legendgroup="previsao",
+                        hovertemplate="<b>%{text}</b><extra></extra>",
+                        showlegend=False,
+                    )
+                )
+                fig.add_traces(legenda)
+                print("✅ Overlay previsão: Choroplethmapbox OK")
+            except Exception as e_choro:
+                # fallback estável: mapbox.layers
+                print(f"⚠️ Choroplethmapbox falhou, usando fallback mapbox.layers: {repr(e_choro)}")
+                layers = []
+                for i, ft in enumerate(feats):
+                    props = ft.get("properties", {}) or {}
+                    label = props.get("label", f"classe {i}")
+                    hex_color = props.get("hex", "#999999")
+                    ordem = props.get("rank_legenda", i)
+
+                    layers.append({
+                        "sourcetype": "geojson",
+                        "source": {"type": "FeatureCollection", "features": [ft]},
+                        "type": "fill",
+                        "color": hex_color,
+                        "opacity": 0.60,
+                    })
+
+                    # legenda “fake” pra listar classes
+                    fig.add_trace(
+                        go.Scattermapbox(
+                            lat=[CENTER_LAT],
+                            lon=[CENTER_LON],
+                            mode="markers",
+                            marker=dict(size=10, color=hex_color, opacity=0),
+                            name=label,
+                            legendgroup="previsao",
+                            legendrank=ordem,
+                            hoverinfo="skip",
+                            showlegend=True,
+                        )
+                    )
+                fig.update_layout(mapbox=dict(layers=layers))
+                print("✅ Overlay previsão: mapbox.layers OK")
+
+            if var_key == "prec_acum":
+                titulo_prev = "Camada previsão: Precipitação acumulada"
+            else:
+                titulo_prev = f"Camada previsão: {VAR_OPCOES[var_key]['label']} – {formatar_label_br(data_iso)}" if data_iso else f"Camada previsão: {VAR_OPCOES[var_key]['label']}"
+    except Exception as e:
+        print(f"❌ ERRO no overlay (previsão): {repr(e)}")
+        titulo_prev = "Camada previsão: (erro ao carregar)"
+
+    layers = tuple(l.to_plotly_json() for l in fig.layout.mapbox.layers)
+    return _dados_figura(fig), layers, titulo_prev
+
+@lru_cache(maxsize=1)
+def camada_sgb() -> tuple:
+    """Traces de contorno dos setores de risco do SGB."""
+    fig = go.Figure()
+    try:
+        arq_sgb = resolver_arquivo_geojson_sgb()
+        print(f"ℹ️ Overlay: tentando SGB -> {arq_sgb}")
+        add_sgb_risk_layer(
+            fig=fig,
+            geojson_path=arq_sgb,
+            center_lat=CENTER_LAT,
+            center_lon=CENTER_LON,
+            line_width=2,
+            show_colorbar=False
+        )
+    except Exception as e:
+        print(f"❌ ERRO no overlay (SGB): {repr(e)}")
+    return _dados_figura(fig)
+
+@lru_cache(maxsize=len(UNIDADES_KEYS))
+def camada_unidades(camada: str) -> tuple:
+    """Trace de pontos das unidades de saúde (vazia se a camada não tiver pontos ou for desconhecida)."""
+    if camada not in UNIDADES_KEYS:
+        return ()
+    try:
+        kwargs = kwargs_trace_unidades(camada)
+        print(f"ℹ️ Overlay: pontos unidades = {len(kwargs['lat']) if kwargs else 0}")
+        if kwargs:
+            return _dados_figura(go.Figure(go.Scattermapbox(**kwargs)))
+    except Exception as e:
+        print(f"❌ ERRO no overlay (unidades): {repr(e)}")
+    return ()
+
+def _figura_overlay_base() -> dict:
+    """Mapa base (centro/zoom/legenda) + âncora invisível, sem nenhuma camada."""
     fig = go.Figure()
 
-    # ✅ REMOVIDO minzoom/maxzoom (Plotly 6+ não aceita no layout.mapbox)
     fig.update_layout(
-        mapbox=dict(
-            style="open-street-map",
-            center=dict(lat=center_lat, lon=center_lon),
-            zoom=2.8,
-            bounds=dict(west=lon_min, east=lon_max, south=lat_min, north=lat_max),
-            layers=[],
-        ),
-        margin=dict(l=0, r=0, t=45, b=0),
-        paper_bgcolor="white",
-        plot_bgcolor="white",
+        mapbox=_MAPBOX_LAYOUT,
         showlegend=True,
         legend=dict(
             orientation="v",
@@ -699,8 +1139,8 @@ def construir_mapa_sobreposicao(var_key: str, data_iso: str | None, camada_unida
     # âncora invisível pra garantir mapbox sempre
     fig.add_trace(
         go.Scattermapbox(
-            lat=[center_lat],
-            lon=[center_lon],
+            lat=[CENTER_LAT],
+            lon=[CENTER_LON],
             mode="markers",
             marker=dict(size=1, opacity=0),
             hoverinfo="skip",
@@ -708,165 +1148,49 @@ def construir_mapa_sobreposicao(var_key: str, data_iso: str | None, camada_unida
             name="_base",
         )
     )
+    return fig.to_dict()
 
-    titulo_prev = "Camada previsão: (desligada)"
+# montado uma única vez; cada overlay só copia a casca e acrescenta as camadas
+_OVERLAY_BASE = _figura_overlay_base()
 
-    # --- PREVISÃO (POLÍGONOS) ---
+def construir_mapa_sobreposicao(var_key: str, data_iso: str | None, camada_unidade: str,
+                               mostrar_previsao: bool, mostrar_unidades: bool, mostrar_sgb: bool,
+                               versao_previsao: tuple[str | None, int | None] = (None, None)) -> dict:
+    """Junta o mapa base com as camadas ligadas (cada uma vem do seu próprio cache)."""
+    data = list(_OVERLAY_BASE["data"])
+    layout = dict(_OVERLAY_BASE["layout"])
+
+    titulo_prev = "Camada previsão: (desligada)"
     if mostrar_previsao:
-        try:
-            p = caminho_camadas_previsao_exata(var_key, data_iso)
-            print(f"ℹ️ Overlay: tentando camada previsão -> {p}")
-            feats = carregar_geojson_poligonos_por_classe(p)
-            print(f"ℹ️ Overlay: features carregadas = {len(feats)}")
-
-            if not feats:
-                if var_key == "prec_acum":
-                    titulo_prev = "Camada previsão: Precipitação acumulada (arquivo não encontrado)"
-                else:
-                    titulo_prev = (
-                        f"Camada previsão: {VAR_OPCOES[var_key]['label']} – {formatar_label_br(data_iso)} (arquivo não encontrado)"
-                        if data_iso else "Camada previsão: (arquivo não encontrado)"
-                    )
-            else:
-                # tenta Choroplethmapbox “correto”
-                try:
-                    for i, ft in enumerate(feats):
-                        props = ft.get("properties", {}) or {}
-                        label = props.get("label", f"classe {i}")
-                        hex_color = props.get("hex", "#999999")
-                        ordem = int(props.get("ordem", i))
-
-                        ft2 = dict(ft)
-                        ft2_props = dict(props)
-                        ft2_props["id"] = f"classe_{ordem}"
-                        ft2["properties"] = ft2_props
-
-                        gj_one = {"type": "FeatureCollection", "features": [ft2]}
-
-                        fig.add_trace(
-                            go.Choroplethmapbox(
-                                geojson=gj_one,
-                                featureidkey="properties.id",
-                                locations=[ft2_props["id"]],
-                                z=[1],
-                                colorscale=[[0, hex_color], [1, hex_color]],
-                                showscale=False,
-                                marker_opacity=0.60,
-                                marker_line_width=0,
-                                marker_line_color="rgba(0,0,0,0)",
-                                name=label,
-                                legendgroup="previsao",
-                                legendrank=ordem,
-                                hovertemplate=f"<b>{label}</b><extra></extra>",
-                                showlegend=True,
-                            )
-                        )
-                    print("✅ Overlay previsão: Choroplethmapbox OK")
-                except Exception as e_choro:
-                    # fallback estável: mapbox.layers
-                    print(f"⚠️ Choroplethmapbox falhou, usando fallback mapbox.layers: {repr(e_choro)}")
-                    layers = []
-                    for i, ft in enumerate(feats):
-                        props = ft.get("properties", {}) or {}
-                        label = props.get("label", f"classe {i}")
-                        hex_color = props.get("hex", "#999999")
-                        ordem = int(props.get("ordem", i))
-
-                        layers.append({
-                            "sourcetype": "geojson",
-                            "source": {"type": "FeatureCollection", "features": [ft]},
-                            "type": "fill",
-                            "color": hex_color,
-                            "opacity": 0.60,
-                        })
-
-                        # legenda “fake” pra listar classes
-                        fig.add_trace(
-                            go.Scattermapbox(
-                                lat=[center_lat],
-                                lon=[center_lon],
-                                mode="markers",
-                                marker=dict(size=10, color=hex_color, opacity=0),
-                                name=label,
-                                legendgroup="previsao",
-                                legendrank=ordem,
-                                hoverinfo="skip",
-                                showlegend=True,
-                            )
-                        )
-                    fig.update_layout(mapbox=dict(layers=layers))
-                    print("✅ Overlay previsão: mapbox.layers OK")
-
-                if var_key == "prec_acum":
-                    titulo_prev = "Camada previsão: Precipitação acumulada"
-                else:
-                    titulo_prev = f"Camada previsão: {VAR_OPCOES[var_key]['label']} – {formatar_label_br(data_iso)}" if data_iso else f"Camada previsão: {VAR_OPCOES[var_key]['label']}"
-        except Exception as e:
-            print(f"❌ ERRO no overlay (previsão): {repr(e)}")
-            titulo_prev = "Camada previsão: (erro ao carregar)"
-
-    # --- SGB (SETOR DE RISCO) — POLÍGONOS ORIGINAIS, SÓ CONTORNO ---
+        traces, layers, titulo_prev = camada_previsao(var_key, data_iso, *versao_previsao)
+        data += traces
+        if layers:
+            layout["mapbox"] = {**layout["mapbox"], "layers": list(layers)}
     if mostrar_sgb:
-        try:
-            arq_sgb = resolver_arquivo_geojson_sgb()
-            print(f"ℹ️ Overlay: tentando SGB -> {arq_sgb}")
-            add_sgb_risk_layer(
-                fig=fig,
-                geojson_path=arq_sgb,
-                center_lat=center_lat,
-                center_lon=center_lon,
-                line_width=2,
-                show_colorbar=False
-            )
-        except Exception as e:
-            print(f"❌ ERRO no overlay (SGB): {repr(e)}")
-
-    # --- UNIDADES (PONTOS) ---
+        data += camada_sgb()
     if mostrar_unidades:
-        try:
-            arq = resolver_arquivo_geojson_unidades(camada_unidade)
-            print(f"ℹ️ Overlay: tentando unidades -> {arq}")
-            lats, lons, custom = carregar_geojson_points(arq, camada_unidade)
-            print(f"ℹ️ Overlay: pontos unidades = {len(lats)}")
-
-            if lats and lons:
-                fig.add_trace(
-                    go.Scattermapbox(
-                        lat=lats,
-                        lon=lons,
-                        mode="markers",
-                        marker=dict(size=7, opacity=0.9, color="black"),
-                        customdata=custom,
-                        hovertemplate=(
-                            "<b>%{customdata[1]}</b><br>"
-                            "Camada: %{customdata[0]}<br>"
-                            "CNES: %{customdata[2]}<br>"
-                            "CD_MUN: %{customdata[3]}<br>"
-                            "DSEI: %{customdata[4]}<br>"
-                            "Polo: %{customdata[5]} (%{customdata[6]})<br>"
-                            "Lat/Lon: %{customdata[7]:.3f}, %{customdata[8]:.3f}"
-                            "<extra></extra>"
-                        ),
-                        name=f"Unidades – {camada_unidade.upper()}",
-                        legendgroup="unidades",
-                        showlegend=True,
-                    )
-                )
-        except Exception as e:
-            print(f"❌ ERRO no overlay (unidades): {repr(e)}")
+        data += camada_unidades(camada_unidade)
 
     titulo = (
         f"Sobreposição – {titulo_prev}"
         f" + {('SGB: (ligado)' if mostrar_sgb else 'SGB: (desligado)')}"
         f" + {('Unidades: ' + camada_unidade.upper()) if mostrar_unidades else 'Unidades: (desligadas)'}"
     )
-    datarevision_key = f"{var_key}|{data_iso}|{camada_unidade}|{int(mostrar_previsao)}|{int(mostrar_unidades)}|{int(mostrar_sgb)}"
-
-    fig.update_layout(
-        title=dict(text=titulo, x=0.5, xanchor="center"),
-        datarevision=datarevision_key,
+    layout["title"] = dict(text=titulo)
+    layout["datarevision"] = f"{var_key}|{data_iso}|{camada_unidade}|{int(mostrar_previsao)}|{int(mostrar_unidades)}|{int(mostrar_sgb)}"
+    return {"data": data, "layout": layout}
+
+@lru_cache(maxsize=256)
+def construir_mapa_sobreposicao_cache(var_key: str, data_iso: str | None, camada_unidade: str,
+                                      mostrar_previsao: bool, mostrar_unidades: bool, mostrar_sgb: bool,
+                                      versao_previsao: tuple[str | None, int | None] = (None, None)) -> dict:
+    """
+    Memoiza a figura do overlay (já como dict) pelos argumentos, que são todos hashable.
+    versao_previsao (caminho, mtime_ns) faz a figura ser refeita quando o arquivo da camada muda.
+    """
+    return construir_mapa_sobreposicao(
+        var_key, data_iso, camada_unidade, mostrar_previsao, mostrar_unidades, mostrar_sgb, versao_previsao
     )
-    return fig
 
 # ----------------- PREPARA LISTA DE DATAS ----------------- #
 DATAS = listar_datas_disponiveis()
@@ -876,12 +1200,127 @@ if not DATAS:
         f"Certifique-se de que existam arquivos ecmwf_prec_YYYY-MM-DD.png."
     )
 DATA_DEFAULT = DATAS[-1]
+DATE_DROPDOWN_OPTIONS = [{"label": formatar_label_br(d), "value": d} for d in DATAS]
+
+# índice de PNGs (stat de cada arquivo) e pontos das unidades são independentes: em paralelo
+with ThreadPoolExecutor(max_workers=2) as _pool:
+    for _tarefa in [_pool.submit(preencher_png_urls, DATAS), _pool.submit(preencher_unit_cache)]:
+        _tarefa.result()  # propaga exceção do boot
+
+# o que o navegador precisa para montar sozinho o mapa diário e o acumulado (sem ida ao servidor)
+DADOS_MAPA_DIARIO = {
+    "titulos": {k: v["label"] for k, v in VAR_OPCOES.items() if v["usa_data"]},
+    "urls": {
+        k: {d: PNG_URLS[(k, d)] for d in DATAS if (k, d) in PNG_URLS}
+        for k, v in VAR_OPCOES.items() if v["usa_data"]
+    },
+    "imagem": _imagem_mapa(""),
+    "base": construir_figura_estatica("", "").to_dict(),
+    "acumulado": construir_figura_estatica(
+        url_imagem("prec_acum", None), VAR_OPCOES["prec_acum"]["label"]
+    ).to_dict(),
+}
+
+def aquecer_figuras() -> None:
+    """
+    Monta no boot as figuras que todo usuário pede: as animações (só URLs, baratas),
+    as camadas de unidades e o overlay do estado inicial da página. O resto do produto
+    (var x data x camada x checkboxes) fica sob demanda nos lru_cache.
+    """
+    for var_key, info in VAR_OPCOES.items():
+        if info["usa_data"]:
+            animacao_cache(var_key)
+    for key in UNIDADES_KEYS:
+        camada_unidades(key)
+    construir_mapa_sobreposicao_cache(
+        "prec_acum", None, "upa", True, True, True, versao_camada_previsao("prec_acum", None)
+    )
+
+aquecer_figuras()
 
 # ----------------- APP DASH ----------------- #
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# update_title=None: sem repintar "Updating..." na aba a cada callback
+app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], update_title=None)
 server = app.server
+# respostas dos callbacks (figuras/GeoJSON em JSON) comprimem muito bem
+server.config.update(
+    COMPRESS_MIMETYPES=["application/json", "text/html"],
+    COMPRESS_ALGORITHM=["br", "gzip"],
+)
+Compress(server)
 app.title = "Previsão ECMWF - Painel de Mapas"
 
+
+@server.route(f"{PNG_ROUTE}<nome>")
+def servir_png(nome: str):
+    # só expõe os PNGs de previsão (nada de .py/.json da raiz)
+    if not (nome.startswith("ecmwf_") and nome.endswith(".png")):
+        abort(404)
+    return send_from_directory(IMG_DIR, nome)
+
+
+@server.after_request
+def cache_headers_png(resp):
+    # as URLs levam ?v=mtime, então o navegador pode reaproveitar o PNG entre frames/sessões
+    if resp.mimetype == "image/png" and request.path.startswith(PNG_ROUTE):
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+    return resp
+
+
+# ----------------- CACHE DAS RESPOSTAS JÁ SERIALIZADAS ----------------- #
+# Os callbacks de figura são determinísticos pelas entradas: guardamos o corpo JSON
+# pronto e, na repetição, devolvemos direto (sem montar nem serializar a figura de novo).
+RESP_CACHE_OUTPUTS = {"store-animacao.data", "graph-overlay.figure"}
+RESP_CACHE_MAX = 128
+# corpo do request -> (corpo da resposta, validação); validação é (var_key, data_iso, versão da
+# camada de previsão) quando a figura depende de um arquivo de camada, senão None
+_RESP_CACHE: OrderedDict[bytes, tuple[bytes, tuple | None]] = OrderedDict()
+_RESP_CACHE_LOCK = threading.Lock()
+_DASH_UPDATE_PATH = f"{app.config.routes_pathname_prefix}_dash-update-component"
+
+
+@server.before_request
+def servir_resposta_cacheada():
+    if request.method != "POST" or request.path != _DASH_UPDATE_PATH:
+        return None
+    corpo_req = request.get_data(cache=True)
+    try:
+        payload = json.loads(corpo_req)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):  # JSON válido mas não é objeto ([], "x"...): o Dash que responda
+        return None
+    if payload.get("output") not in RESP_CACHE_OUTPUTS:
+        return None
+
+    with _RESP_CACHE_LOCK:
+        entrada = _RESP_CACHE.get(corpo_req)
+    if entrada is not None:
+        corpo, validacao = entrada
+        # arquivo da camada criado/removido/regerado desde que a resposta foi guardada: refaz
+        if validacao is None or versao_camada_previsao(validacao[0], validacao[1]) == validacao[2]:
+            with _RESP_CACHE_LOCK:
+                if corpo_req in _RESP_CACHE:
+                    _RESP_CACHE.move_to_end(corpo_req)
+            return Response(corpo, mimetype="application/json")
+    g.resp_cache_key = corpo_req
+    return None
+
+
+@server.after_request
+def guardar_resposta_cacheada(resp):
+    chave = g.pop("resp_cache_key", None)
+    validacao = g.pop("resp_cache_validacao", None)
+    if chave is None or resp.status_code != 200 or resp.direct_passthrough:
+        return resp
+    with _RESP_CACHE_LOCK:
+        _RESP_CACHE[chave] = (resp.get_data(), validacao)
+        _RESP_CACHE.move_to_end(chave)
+        while len(_RESP_CACHE) > RESP_CACHE_MAX:
+            _RESP_CACHE.popitem(last=False)
+    return resp
+
+
 app.layout = dbc.Container(
     [
         dbc.Row(
@@ -929,7 +1368,7 @@ app.layout = dbc.Container(
                                 html.Label("Variável meteorológica", className="fw-bold"),
                                 dcc.RadioItems(
                                     id="radio-var",
-                                    options=[{"label": v["label"], "value": k} for k, v in VAR_OPCOES.items()],
+                                    options=VAR_RADIO_OPTIONS,
                                     value="prec_acum",
                                     labelStyle={"display": "block", "marginBottom": "0.35rem"},
                                     className="mb-3",
@@ -938,7 +1377,7 @@ app.layout = dbc.Container(
                                 html.Label("Data da previsão", className="fw-bold"),
                                 dcc.Dropdown(
                                     id="dropdown-data",
-                                    options=[{"label": formatar_label_br(d), "value": d} for d in DATAS],
+                                    options=DATE_DROPDOWN_OPTIONS,
                                     value=DATA_DEFAULT,
                                     clearable=False,
                                     className="mb-3",
@@ -1007,17 +1446,22 @@ app.layout = dbc.Container(
                                     dcc.Graph(
                                         id="graph-overlay",
                                         style={"height": "78vh"},
-                                        config={"scrollZoom": True, "displayModeBar": False},
+                                        config={"scrollZoom": True, "displayModeBar": False, "doubleClick": "reset"},
                                     ),
                                     label="Mapa integrado",
                                     tab_id="tab-overlay",
                                 ),
                                 dbc.Tab(
-                                    dcc.Graph(
-                                        id="graph-mapa",
-                                        style={"height": "78vh"},
-                                        config={"scrollZoom": True, "displayModeBar": False},
-                                    ),
+                                    [
+                                        dcc.Graph(
+                                            id="graph-mapa",
+                                            style={"height": "78vh"},
+                                            config={"scrollZoom": True, "displayModeBar": False, "doubleClick": "reset"},
+                                        ),
+                                        dcc.Store(id="store-prefetch-frames"),
+                                        dcc.Store(id="store-mapa-diario", data=DADOS_MAPA_DIARIO),
+                                        dcc.Store(id="store-animacao"),
+                                    ],
                                     label="Figura meteorológica",
                                     tab_id="tab-figura",
                                 ),
@@ -1061,31 +1505,61 @@ def atualizar_cards_resumo(data_iso, var_key):
 def atualizar_cards_saude(data_iso, var_key):
     return montar_cards_saude(data_iso, var_key)
 
+# Só a animação precisa do servidor (figura com um frame por data, montada uma vez em
+# ANIM_CACHE); ela vai para o store-animacao marcada com a variável a que pertence.
 @app.callback(
+    Output("store-animacao", "data"),
+    Input("radio-var", "value"),
+    Input("radio-modo", "value"),
+)
+def atualizar_animacao(var_key, modo):
+    if modo != "anim" or not VAR_OPCOES.get(var_key, {}).get("usa_data"):
+        return no_update
+    return {"var": var_key, "figura": animacao_cache(var_key)}
+
+# Único dono do graph-mapa.figure: o mapa diário e o acumulado são montados no navegador a
+# partir do store-mapa-diario; no modo animação usa a figura do store-animacao só se ela for
+# da variável selecionada agora (resposta atrasada de outra variável é ignorada).
+app.clientside_callback(
+    """
+    function(data_iso, var_key, modo, animacao, dados) {
+        var nada = window.dash_clientside.no_update;
+        var gatilhos = (window.dash_clientside.callback_context.triggered || []).map(function(t) {
+            return t.prop_id.split(".")[0];
+        });
+        var so = function(id) { return gatilhos.length === 1 && gatilhos[0] === id; };
+
+        if (!var_key) { return {data: [], layout: {}}; }
+
+        if (var_key === "prec_acum") {
+            // o acumulado não depende da data nem da animação
+            return (so("dropdown-data") || so("store-animacao")) ? nada : dados.acumulado;
+        }
+
+        if (modo !== "dia") {
+            if (so("dropdown-data")) { return nada; }  // a animação já percorre todas as datas
+            return (animacao && animacao.var === var_key) ? animacao.figura : nada;
+        }
+
+        if (so("store-animacao")) { return nada; }
+        if (!data_iso) { return {data: [], layout: {}}; }
+        var p = data_iso.split("-");
+        var src = ((dados.urls || {})[var_key] || {})[data_iso];
+        var layout = Object.assign({}, dados.base.layout);
+        layout.images = src ? [Object.assign({}, dados.imagem, {source: src})] : [];
+        layout.title = Object.assign({}, layout.title, {
+            text: dados.titulos[var_key] + " – " + p[2] + "/" + p[1] + "/" + p[0]
+        });
+        return Object.assign({}, dados.base, {layout: layout});
+    }
+    """,
     Output("graph-mapa", "figure"),
     Input("dropdown-data", "value"),
     Input("radio-var", "value"),
     Input("radio-modo", "value"),
+    Input("store-animacao", "data"),
+    State("store-mapa-diario", "data"),
 )
-def atualizar_mapa_previsao(data_iso, var_key, modo):
-    if var_key is None:
-        return go.Figure()
-
-    info = VAR_OPCOES[var_key]
-
-    if var_key == "prec_acum":
-        src = carregar_imagem_base64("prec_acum", None)
-        return construir_figura_estatica(src, info["label"])
-
-    if modo == "dia":
-        if data_iso is None:
-            return go.Figure()
-        titulo = f"{info['label']} – {formatar_label_br(data_iso)}"
-        src = carregar_imagem_base64(var_key, data_iso)
-        return construir_figura_estatica(src, titulo)
-
-    titulo = f"{info['label']} – (animação)"
-    return construir_animacao(var_key, DATAS, titulo)
 
 @app.callback(
     Output("graph-overlay", "figure"),
@@ -1100,17 +1574,69 @@ def atualizar_overlay(data_iso, var_key, camada_unidade, check_values):
     mostrar_unidades = "uni" in check_values
     mostrar_sgb = "sgb" in check_values
 
-    return construir_mapa_sobreposicao(
-        var_key=var_key,
-        data_iso=data_iso,
-        camada_unidade=camada_unidade or "upa",
-        mostrar_previsao=mostrar_previsao,
-        mostrar_unidades=mostrar_unidades,
-        mostrar_sgb=mostrar_sgb,
+    # entrada que não altera nada do que está desenhado: mantém a figura atual
+    gatilho = ctx.triggered_id
+    if (
+        (gatilho == "dropdown-data" and (var_key == "prec_acum" or not mostrar_previsao))
+        or (gatilho == "radio-var" and not mostrar_previsao)
+        or (gatilho == "dropdown-unidades" and not mostrar_unidades)
+    ):
+        return no_update
+
+    # valor fora da lista do dropdown (request forjado): cai na camada padrão
+    if camada_unidade not in UNIDADES_KEYS:
+        camada_unidade = "upa"
+
+    # a camada acumulada não depende da data: mesma entrada de cache para qualquer dia
+    if var_key == "prec_acum":
+        data_iso = None
+
+    versao_previsao = (None, None)
+    if mostrar_previsao:
+        versao_previsao = versao_camada_previsao(var_key, data_iso)
+        # a resposta cacheada por corpo do request só vale enquanto o arquivo for o mesmo
+        g.resp_cache_validacao = (var_key, data_iso, versao_previsao)
+
+    # posicional, como em aquecer_figuras(): o lru_cache diferencia args nomeados de posicionais
+    return construir_mapa_sobreposicao_cache(
+        var_key, data_iso, camada_unidade,
+        mostrar_previsao, mostrar_unidades, mostrar_sgb,
+        versao_previsao,
     )
 
+# Pré-carrega no navegador, em segundo plano e em ordem, os PNGs dos frames da animação:
+# o primeiro frame aparece logo e os seguintes já estão em cache quando o Play chega neles.
+app.clientside_callback(
+    """
+    function(fig) {
+        if (!fig || !fig.frames || !fig.frames.length) {
+            return window.dash_clientside.no_update;
+        }
+        var fila = [];
+        fig.frames.forEach(function(fr) {
+            ((fr.layout || {}).images || []).forEach(function(im) {
+                if (im.source) { fila.push(im.source); }
+            });
+        });
+        var token = {};
+        window._painelPrefetchFrames = token;  // figura nova cancela o pré-carregamento anterior
+        function proximo() {
+            if (window._painelPrefetchFrames !== token || !fila.length) { return; }
+            var img = new Image();
+            img.onload = img.onerror = proximo;
+            img.src = fila.shift();
+        }
+        for (var i = 0; i < 4; i++) { proximo(); }
+        return fila.length;
+    }
+    """,
+    Output("store-prefetch-frames", "data"),
+    Input("graph-mapa", "figure"),
+)
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8050, debug=True)
+    # debug liga o hot reloader, que importa o módulo duas vezes (e refaz todos os caches)
+    app.run(host="0.0.0.0", port=8050, debug=os.environ.get("DASH_DEBUG") == "1")
 
 
 
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Recomprime (sem perdas) os PNGs de previsão com o oxipng.
+
+Rodar depois da geração das figuras ECMWF e antes do deploy:
+
+    python scripts/otimizar_pngs.py            # todos os ecmwf_*.png da raiz
+    python scripts/otimizar_pngs.py a.png b.png
+
+Menos bytes por PNG = download mais rápido de cada frame no painel.
+"""
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+OXIPNG_ARGS = ["--opt", "4", "--strip", "safe"]
+LOTE = 200  # arquivos por chamada (evita linha de comando gigante)
+
+
+def main(argv: list[str]) -> int:
+    oxipng = shutil.which("oxipng")
+    if oxipng is None:
+        print("⚠️ oxipng não encontrado no PATH (https://github.com/shssoichiro/oxipng).")
+        return 1
+
+    pngs = [Path(a) for a in argv] if argv else sorted(BASE_DIR.glob("ecmwf_*.png"))
+    if not pngs:
+        print("ℹ️ Nenhum PNG para otimizar.")
+        return 0
+
+    antes = sum(p.stat().st_size for p in pngs)
+    for i in range(0, len(pngs), LOTE):
+        subprocess.run([oxipng, *OXIPNG_ARGS, *map(str, pngs[i:i + LOTE])], check=True)
+    depois = sum(p.stat().st_size for p in pngs)
+
+    print(f"✅ {len(pngs)} PNGs: {antes / 1e6:.1f} MB -> {depois / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))